@@ -1,31 +1,188 @@
+import os
 import math
 import hashlib
 import numbers
+import functools
+
+import numpy as np
+
+# A Bloom filter has no security requirement, so a fast non-cryptographic
+# hash is preferred over md5/sha. xxh128 is the fastest widely available
+# 128-bit hash; fall back to murmur3 if xxhash is not installed.
+try:
+    import xxhash
+
+    def _hash_128(data):
+        '''Returns the 16-byte xxh128 digest of a bytes object'''
+        return xxhash.xxh128(data).digest()
+except ImportError:
+    import mmh3
+
+    def _hash_128(data):
+        '''Returns the 16-byte murmur3 digest of a bytes object'''
+        return mmh3.hash_bytes(data)
+
+
+def _hash_sha256(data):
+    '''Returns the first 16 bytes of the sha256 digest of a bytes object
+
+    OpenSSL dispatches sha256 to the SHA-NI hardware instructions on
+    capable CPUs, which can beat a software hash on long inputs.
+
+    '''
+    return hashlib.sha256(data).digest()[:16]
+
+
+# Available hash backends, selectable per filter via hash_name
+_HASHERS = {'xxh128': _hash_128, 'sha256': _hash_sha256}
+
+# Optional C-extension backend (pybloomfiltermmap3), selectable via
+# BloomFilter.from_backend('c')
+try:
+    import pybloomfilter
+except ImportError:
+    pybloomfilter = None
+
+# The block probe loops are compiled to native code with numba when it
+# is available; without it they run as plain (slow) Python.
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        '''No-op replacement for numba.njit'''
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# Salt constants used to derive the 8 in-block bit positions of a split
+# block Bloom filter. These are the constants standardized by Parquet
+# (also used by Impala and Kudu). Held as uint64 so that key * salt in
+# the kernels stays within uint64 (key < 2^32, salt < 2^32) and never
+# overflows, with or without numba.
+_SALT = np.array([0x47b6137b, 0x44974d91, 0x8824ad5b, 0xa2b7289d,
+                  0x705495c7, 0x2df1424b, 0x9efc4947, 0x5c6bfb31],
+                 dtype=np.uint64)
+
+# Each block is 8 x 32 bits = one 256-bit cache line
+_BLOCK_BITS = 256
+
+
+@njit(cache=True)
+def _block_insert(blocks, block_index, key):
+    '''Sets the 8 bits of a word within blocks[block_index]
+
+    Lane i's bit position is the top 5 bits of the low 32 bits of
+    key * _SALT[i], where key is the low 32 bits of the word's h2 hash
+    (as a uint64, so the product cannot overflow).
+
+    '''
+    for i in range(8):
+        bit = (key * _SALT[i] >> np.uint64(27)) & np.uint64(31)
+        blocks[block_index, i] |= np.uint32(1) << np.uint32(bit)
+
+
+@njit(cache=True)
+def _block_check(blocks, block_index, key):
+    '''Checks that the 8 bits of a word are set within blocks[block_index]
+
+    Accumulates the missing bits of all 8 lanes and tests once at the
+    end: straight-line code with no data-dependent branches.
+
+    '''
+    missing = np.uint32(0)
+    for i in range(8):
+        bit = (key * _SALT[i] >> np.uint64(27)) & np.uint64(31)
+        missing |= ~blocks[block_index, i] & (np.uint32(1) << np.uint32(bit))
+    return missing == np.uint32(0)
+
+
+@njit(cache=True)
+def _block_insert_batch(blocks, block_mask, h1s, h2s):
+    '''Inserts a batch of pre-hashed words in one compiled loop'''
+    for j in range(h1s.shape[0]):
+        block_index = h1s[j] & np.uint64(block_mask)
+        key = h2s[j] & np.uint64(0xffffffff)
+        _block_insert(blocks, block_index, key)
+
+
+@njit(cache=True)
+def _block_check_batch(blocks, block_mask, h1s, h2s, out):
+    '''Checks a batch of pre-hashed words in one compiled loop'''
+    for j in range(h1s.shape[0]):
+        block_index = h1s[j] & np.uint64(block_mask)
+        key = h2s[j] & np.uint64(0xffffffff)
+        out[j] = _block_check(blocks, block_index, key)
 
 
 class BloomFilter:
 
-    def __init__(self, num_words, num_bits):
+    def __init__(self, num_words, num_bits, hash_name='xxh128',
+                 cache_hashes=False, backing_file=None):
         '''
-        Creates a Bloom Filter with the specified number of bits.
-        The number of hash functions used is automatically chosen to minimize
-        the probability of false positives for the given number of bits and the
-        number of words expected to be added to the filter.
+        Creates a split block Bloom Filter with the specified number of bits.
+
+        The filter is laid out as an array of 256-bit blocks, the layout
+        used by Parquet and Impala. Each word hashes to exactly one block,
+        and to 8 bit positions within it (one per 32-bit lane), so the k
+        probes of an add/query all touch a single cache line instead of k
+        random cache lines scattered across the whole bit array.
+
+        The number of bits is rounded up to the next power of two (and to
+        at least one block), so that hashes can be reduced to a block
+        index with a bitmask instead of a slow 64-bit modulo.
 
         Args:
             num_words (int): number of words expected to be stored in filter
             num_bits (int) : number of bits to represent the filter contents
+                             (rounded up to the next power of two)
+            hash_name (str): hash backend, 'xxh128' (default) or 'sha256'
+                             (hardware accelerated via SHA-NI where
+                             OpenSSL supports it)
+            cache_hashes (bool): memoize the hash pair per word. Worth
+                             enabling only when the same words are added
+                             or queried repeatedly; for mostly-unique
+                             words the cache bookkeeping is pure overhead
+            backing_file (str): path to a file to mmap the blocks into
+                             instead of holding them in RAM. The OS pages
+                             blocks in on demand (each probe touches only
+                             one 32-byte line, so the resident set stays
+                             small even for multi-GB filters), and the
+                             filter persists across runs: an existing
+                             file of the right size is reopened with its
+                             contents intact
 
         '''
         BloomFilter._validate_num_words(num_words)
         BloomFilter._validate_num_bits(num_bits)
+        BloomFilter._validate_hash_name(hash_name)
+        self._hash_name = hash_name
+        self._hash = _HASHERS[hash_name]
+        if cache_hashes:
+            self._get_hash_pair = functools.lru_cache(maxsize=1 << 16)(
+                self._get_hash_pair)
+        num_bits = max(_BLOCK_BITS, 1 << (num_bits - 1).bit_length())
         self._num_words = num_words
         self._num_bits = num_bits
         self._false_positive_prob = BloomFilter._calculate_false_positive(
                                                         num_words, num_bits)
-        self._num_hash = BloomFilter._calculate_num_hash(num_words, num_bits)          
-        self._bit_array = [False]*num_bits
-        # TODO: replace list of bools with a bitarray to reduce space overhead
+        # The split block layout always sets one bit per 32-bit lane
+        self._num_hash = 8
+        self._num_blocks = num_bits // _BLOCK_BITS
+        self._block_mask = self._num_blocks - 1
+        shape = (self._num_blocks, 8)
+        if backing_file is None:
+            self._blocks = np.zeros(shape, dtype=np.uint32)
+        else:
+            # Reopen an existing file in place; create and zero-fill
+            # otherwise ('w+' truncates, 'r+' requires the file to exist)
+            num_bytes = self._num_blocks * _BLOCK_BITS // 8
+            if (os.path.exists(backing_file)
+                    and os.path.getsize(backing_file) == num_bytes):
+                mode = 'r+'
+            else:
+                mode = 'w+'
+            self._blocks = np.memmap(backing_file, dtype=np.uint32,
+                                     mode=mode, shape=shape)
     
     @property
     def num_words(self):
@@ -44,11 +201,46 @@ class BloomFilter:
      
     @property
     def num_hash(self):
-        '''int: num of hash functions required to minimize false positives'''
+        '''int: number of bits set per word (one per 32-bit lane of a block)'''
         return self._num_hash
     
     @classmethod
-    def with_false_positive_constraint(cls, num_words, probability):
+    def from_backend(cls, num_words, num_bits, backend='python'):
+        '''
+        Factory method that selects the filter implementation at
+        construction.
+
+        The 'python' backend is this class. The 'c' backend wraps
+        pybloomfiltermmap3's C-extension filter (murmur hashing, mmapped
+        bit storage) behind the same add/query interface, dropping the
+        whole hot path into C; it requires the optional
+        pybloomfiltermmap3 package.
+
+        Args:
+            num_words (int): capacity of filter
+            num_bits (int) : number of bits to represent filter contents
+            backend (str)  : 'python' (default) or 'c'
+
+        Returns:
+            An instance of a bloom filter
+        '''
+        if backend == 'python':
+            return cls(num_words, num_bits)
+        if backend == 'c':
+            if pybloomfilter is None:
+                raise ImportError("The 'c' backend requires the "
+                                  "pybloomfiltermmap3 package")
+            return _CBackendBloomFilter(num_words, num_bits)
+        raise ValueError("Backend should be 'python' or 'c'")
+
+    @property
+    def count_ones(self):
+        '''int: number of bits set in the filter, an occupancy estimate'''
+        return int(np.bitwise_count(self._blocks).sum())
+
+    @classmethod
+    def with_false_positive_constraint(cls, num_words, probability,
+                                       hash_name='xxh128'):
         ''' 
         Factory method to create a filter given a false positive probability 
         constraint instead of a set number of bits. Calculates the number of 
@@ -57,129 +249,201 @@ class BloomFilter:
         
         Args:
             num_words (int): capacity of filter
-            probability (float): false probability constraint 
-        
+            probability (float): false probability constraint
+            hash_name (str): hash backend, see __init__
+
         Returns:
             An instance of a bloom filter
         '''
         BloomFilter._validate_num_words(num_words)
         BloomFilter._validate_probability(probability)
         num_bits = cls._calculate_num_bits(num_words, probability)
-        return cls(num_words, num_bits)
+        return cls(num_words, num_bits, hash_name)
     
-    def add(self, word) -> None: 
-        ''' 
-        Adds a word to the filter, by computing k hashes: word -> [0, m-1]
-        And setting the corresponding bits in the filter to 1.
-        
+    def add(self, word) -> None:
+        '''
+        Adds a word to the filter, by hashing it to a block and setting
+        the word's 8 bits within that block to 1.
+
         '''
         BloomFilter._validate_word(word)
-        
-        bit_indices = self._get_hashes(word)
-        for i in bit_indices:
-            self._bit_array[i] = True
-            
-    def query(self, word) -> bool: 
-        ''' 
-        Checks if a word is in the filter by calculating its hashes, and
-        verifying if the corresponding indices in the bit array are all set.
-        
+        self._add_unchecked(word.encode())
+
+    def query(self, word) -> bool:
+        '''
+        Checks if a word is in the filter by hashing it to a block, and
+        verifying that the word's 8 bits within that block are all set.
+
         Args:
-            word (string)  
-            
+            word (string)
+
         Returns:
             Boolean: True if word in filter
-            
+
         '''
         BloomFilter._validate_word(word)
-        
-        bit_indices = self._get_hashes(word)        
-        return all([self._bit_array[i] for i in bit_indices])
-    
-    def _get_hashes(self, word):
-        '''Computes k hashes of a word to [0,m-1], k=num_hash
-        
-        To minimize false positives, the hash functions should be independent,
-        and map words uniformly to [0, m-1]. 
-        
-        (Implemented here) For larger problems, we can use the results of "Less
-        Hashing, Same Performace" by Kirsch et al (2007): Using two hash 
-        functions, h1 and h2, we can generate k different hashes 
-        g_i(x) = h_1(x) + i * h_2(x), without compromising asymptotic false 
-        positive probability. 
-        
-        (TODO) For small problem sizes, it is possible to produce independent 
-        hashes by taking k chunks of log2(m) bits from the output of a 'good' 
-        hash function, ex: md5 (since its bits should have little correlation 
-        with each other). This works as long as k*log2(m)<= width of output.
-        
+        return self._query_unchecked(word.encode())
+
+    def union(self, other):
+        '''
+        Returns a new filter containing every word added to either filter.
+
+        Both filters must have the same number of bits and the same hash
+        backend, so that a word maps to the same bits in each. The block
+        arrays are combined with a single vectorized bitwise OR.
+
         Args:
-            word (string)
-            
+            other (BloomFilter): filter to union with
+
         Returns:
-            List of k hashes
-        
+            A new BloomFilter with the capacities of both inputs combined
+
         '''
-        # Computes the md5 hash of the word, and slices it into two halves
-        # to produce 'independent' hashes h1 and h2 
-        h1 = int(hashlib.md5(word.encode()).hexdigest()[:15], 16)
-        h2 = int(hashlib.md5(word.encode()).hexdigest()[16:], 16)
-        
-        return [(h1 + i*h2) % self._num_bits for i in range(1, self.num_hash+1)]
-          
-    @staticmethod
-    def _calculate_num_bits(n, p): 
-        ''' 
-        Required number of bits to represent a vocabulary of size n 
-        while staying within allowable false positive probability,
-        assuming an optimal number of hash functions is used.
-        
+        if not isinstance(other, BloomFilter):
+            raise TypeError("Can only union with another BloomFilter")
+        if (self._num_bits != other._num_bits
+                or self._hash_name != other._hash_name):
+            raise ValueError("Filters should have the same number of bits "
+                             "and hash backend to be unioned")
+        result = BloomFilter(self._num_words + other._num_words,
+                             self._num_bits, self._hash_name)
+        np.bitwise_or(self._blocks, other._blocks, out=result._blocks)
+        return result
+
+    def _add_unchecked(self, word_bytes) -> None:
+        '''Adds an already-encoded word, skipping validation'''
+        h1, h2 = self._get_hash_pair(word_bytes)
+        _block_insert(self._blocks, h1 & self._block_mask,
+                      np.uint64(h2 & 0xffffffff))
+
+    def _query_unchecked(self, word_bytes) -> bool:
+        '''Checks an already-encoded word, skipping validation'''
+        h1, h2 = self._get_hash_pair(word_bytes)
+        return bool(_block_check(self._blocks, h1 & self._block_mask,
+                                 np.uint64(h2 & 0xffffffff)))
+
+    def add_batch(self, words) -> None:
+        '''
+        Adds a batch of words to the filter.
+
+        Equivalent to calling add on each word, but hashes the whole
+        batch up front and inserts it with a single compiled loop over
+        the blocks, instead of re-entering Python once per word.
+
         Args:
-            n (int): numbers of words to be stored in Bloom Filter 
-            p (float): maximum allowable false positive probability
-            
+            words (sequence of strings or bytes): already-encoded words
+                are hashed as-is, skipping the str->bytes conversion
+
+        '''
+        h1s, h2s = self._hash_batch(
+            [w if isinstance(w, bytes) else w.encode() for w in words])
+        _block_insert_batch(self._blocks, self._block_mask, h1s, h2s)
+
+    def query_batch(self, words):
+        '''
+        Checks a batch of words against the filter.
+
+        Equivalent to calling query on each word, but hashes the whole
+        batch up front and probes it with a single compiled loop over
+        the blocks.
+
+        Args:
+            words (sequence of strings or bytes): already-encoded words
+                are hashed as-is, skipping the str->bytes conversion
+
         Returns:
-            m (int): length of bit array -(n * ln(p)) / (ln(2)^2)
-            
+            numpy bool array aligned with words: True if word in filter
+
+        '''
+        h1s, h2s = self._hash_batch(
+            [w if isinstance(w, bytes) else w.encode() for w in words])
+        result = np.empty(len(words), dtype=np.bool_)
+        _block_check_batch(self._blocks, self._block_mask, h1s, h2s, result)
+        return result
+
+    def _hash_batch(self, words_bytes):
+        '''Computes the two 64-bit hash halves of a batch of encoded words
+
+        Args:
+            words_bytes (sequence of bytes)
+
+        Returns:
+            (numpy array, numpy array): uint64 arrays of the h1 and h2
+            halves, aligned with words_bytes
+
         '''
-        m = -(n * math.log(p))/(math.log(2)**2) 
-        return math.ceil(m) 
-  
+        n = len(words_bytes)
+        h1s = np.empty(n, dtype=np.uint64)
+        h2s = np.empty(n, dtype=np.uint64)
+        # Hoist attribute lookups out of the loop; locals are a single
+        # array access per read instead of a dict lookup
+        hash_128 = self._hash
+        from_bytes = int.from_bytes
+        for j, word_bytes in enumerate(words_bytes):
+            digest = hash_128(word_bytes)
+            h1s[j] = from_bytes(digest[:8], 'little')
+            h2s[j] = from_bytes(digest[8:], 'little')
+        return h1s, h2s
+
+    def _get_hash_pair(self, word_bytes):
+        '''Computes the two 64-bit hash halves of an encoded word
+
+        A single 128-bit hash of the word is split into two 64-bit halves
+        h1 and h2. h1 selects the block (via & block_mask, equivalent to
+        % num_blocks since num_blocks is a power of two); the low 32 bits
+        of h2 generate the 8 in-block bit positions inside the compiled
+        kernels.
+
+        Args:
+            word_bytes (bytes)
+
+        Returns:
+            (int, int): the two 64-bit hash halves h1 and h2
+
+        '''
+        digest = self._hash(word_bytes)
+        return (int.from_bytes(digest[:8], 'little'),
+                int.from_bytes(digest[8:], 'little'))
+          
     @staticmethod
-    def _calculate_num_hash(n, m): 
-        ''' 
-        Number of hash functions that minimizes false positive probability
-         
+    def _calculate_num_bits(n, p):
+        '''
+        Required number of bits to represent a vocabulary of size n
+        while staying within allowable false positive probability,
+        given the fixed 8 bits set per word of the split block layout.
+
         Args:
-            n (int): numbers of words to be stored in Bloom Filter 
-            m (int): length of bit array
-            
+            n (int): numbers of words to be stored in Bloom Filter
+            p (float): maximum allowable false positive probability
+
         Returns:
-            k  (int): optimal number of hash functions = (m/n) * ln(2)
-            
+            m (int): length of bit array, from inverting the fixed-k
+            false positive formula: -8n / ln(1 - p^(1/8))
+
         '''
-        # This formula is derived using approximations that assume large n
-        # TODO: Think of more accurate alternatives for small problem sizes
-        # TODO: when k is not an integer, check false positive prob for
-        #      floor(k) and ceil(k), and return the more optimal one
-        k = (m/n) * math.log(2)
-        return int(k)
-    
+        m = -8*n / math.log(1 - p**(1/8))
+        return math.ceil(m)
+
     @staticmethod
     def _calculate_false_positive(n, m):
-        ''' 
-        False positive probability for a given vocabulary size and number 
-        of bits, assuming an optimal number of hash functions is used.
-        
+        '''
+        False positive probability for a given vocabulary size and number
+        of bits, given the fixed 8 bits set per word of the split block
+        layout.
+
         Args:
-            n (int): numbers of words to be stored in Bloom Filter 
+            n (int): numbers of words to be stored in Bloom Filter
             m (int): length of bit array
-            
+
         Returns:
-            p (float): false positive probability
-            
+            p (float): false positive probability (1 - e^(-8n/m))^8
+
         '''
-        return math.exp(-(m/n) * (math.log(2)**2))
+        # Standard fixed-k Bloom approximation with k=8. It treats the
+        # filter as one pooled bit array; the split block layout adds a
+        # small extra false positive mass from unevenly loaded blocks,
+        # which this figure does not include.
+        return (1 - math.exp(-8*n/m))**8
           
     @staticmethod
     def _validate_num_words(n):
@@ -202,6 +466,14 @@ class BloomFilter:
         if p <= 0 or p >= 1:
             raise ValueError("Probability should be a number in (0,1)")
     
+    @staticmethod
+    def _validate_hash_name(hash_name):
+        if not isinstance(hash_name, str):
+            raise TypeError("Hash name should be a string")
+        if hash_name not in _HASHERS:
+            raise ValueError("Hash name should be one of "
+                             + ", ".join(sorted(_HASHERS)))
+
     @staticmethod
     def _validate_word(w):
         if not isinstance(w, str):
@@ -211,4 +483,40 @@ class BloomFilter:
         return "Word Capacity = " + str(self.num_words) + "\n" \
                 + "Number of bits = " + str(self.num_bits) + "\n"\
                 + "False positive probability = " + \
-                str(self.false_positive_probability)    
\ No newline at end of file
+                str(self.false_positive_probability)
+
+
+class _CBackendBloomFilter:
+    '''Thin wrapper delegating add/query to pybloomfiltermmap3
+
+    Presents the same add/query interface as BloomFilter while the hot
+    paths run entirely inside the C extension. Created through
+    BloomFilter.from_backend('c'); the pure-Python BloomFilter remains
+    the reference implementation.
+
+    '''
+
+    def __init__(self, num_words, num_bits):
+        BloomFilter._validate_num_words(num_words)
+        BloomFilter._validate_num_bits(num_bits)
+        self._num_words = num_words
+        # pybloomfilter sizes itself from a capacity and an error rate,
+        # so hand it the rate this module predicts for the requested bits
+        error_rate = BloomFilter._calculate_false_positive(num_words,
+                                                           num_bits)
+        self._filter = pybloomfilter.BloomFilter(num_words, error_rate)
+
+    @property
+    def num_words(self):
+        '''int: number of words expected to be added to the filter'''
+        return self._num_words
+
+    def add(self, word) -> None:
+        '''Adds a word to the filter'''
+        BloomFilter._validate_word(word)
+        self._filter.add(word)
+
+    def query(self, word) -> bool:
+        '''Checks if a word is in the filter'''
+        BloomFilter._validate_word(word)
+        return word in self._filter
\ No newline at end of file
@@ -4,8 +4,10 @@ from BloomFilter import BloomFilter
 def populate_filter(bloom_filter):
 
     n = bloom_filter.num_words
-    for i in range(n):
-        bloom_filter.add(str(i))
+    # Build the keys as bytes directly, skipping the int->str->bytes
+    # chain inside the batch call
+    words = [b'%d' % i for i in range(n)]
+    bloom_filter.add_batch(words)
     print("Added " + str(n) + " words to bloom filter.\n")
 
 
@@ -13,7 +15,8 @@ def test_false_negative(bloom_filter):
 
     print("Querying for items previously added to the filter:")
     n = bloom_filter.num_words
-    num_hits = sum([bloom_filter.query(str(i)) for i in range(n)])
+    words = [b'%d' % i for i in range(n)]
+    num_hits = int(bloom_filter.query_batch(words).sum())
     print(str(num_hits) + " out of " + str(n) + " words found.\n")
 
 
@@ -21,7 +24,8 @@ def test_false_positive(bloom_filter):
 
     print("Querying for 10,000 new words never added to the filter:")
     n = bloom_filter.num_words
-    num_hits = sum([bloom_filter.query(str(i)) for i in range(n, n+10000)])
+    words = [b'%d' % i for i in range(n, n+10000)]
+    num_hits = int(bloom_filter.query_batch(words).sum())
     print("The empirical false positive rate is " + str(num_hits/(10000)))
 
 